@@ -7,6 +7,15 @@ Args:
     -l|--list:		Boolean		List metric names from metrics.json.
     -n|--noop:		Boolean		Do everything except upload to Datadog,
               				print payload to stdin.
+    -p|--profile:	Boolean		Print a per-metric timing breakdown after the run.
+    --snapshot-write:	String		Dump everything fetched from JIRA to this file.
+    --snapshot-read:	String		Evaluate metrics from this file instead of JIRA.
+    -b|--backfill:	String String	Evaluate metrics at every step between two dates.
+    -s|--step:		String		Time between backfill steps, e.g. 6h, 1d, 1w.
+    -S|--shard:		String		Run only the metric/project pairs of shard I/N.
+    -w|--workers:	Integer		Number of local processes to run metrics with.
+    -r|--resume:	Boolean		Resume the last run from its journal.
+    --journal:		String		Private directory to checkpoint the run to.
 Returns:
     On standard run, returns nothing.
 """
@@ -19,6 +28,14 @@ import time
 import logging
 import os
 import hashlib
+import contextlib
+import mmap
+import copy
+import glob
+import fcntl
+import itertools
+import multiprocessing
+import email.utils
 from pprint import pprint
 
 # Check for modules that are required but may not be installed.
@@ -34,6 +51,12 @@ except ImportError:
     logging.critical("jinja2 module not found.")
     sys.exit(71)
 
+try:
+    import jsonschema
+except ImportError:
+    logging.critical("jsonschema module not found.")
+    sys.exit(71)
+
 try:
     from datadog import initialize, api
 except ImportError:
@@ -41,19 +64,569 @@ except ImportError:
     sys.exit(71)
 
 try:
-    from jira import JIRA
+    from jira import JIRA, JIRAError
+    from jira.resources import Issue
 except ImportError:
     logging.critical("jira module not found.")
     sys.exit(71)
 
+class Instrumentation(object):
+    """Collects timings and counters about the jiradog run itself.
+
+    Everything recorded is exported as `jiradog.internal.*` metrics alongside
+    the payload. Timings and counters recorded inside `unit` are tagged with
+    that unit's metric name and project.
+    """
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.unit_tags = ()
+
+    @contextlib.contextmanager
+    def unit(self, metric_name, project):
+        """Tags everything recorded inside the block and times the whole block.
+
+        Args:
+            metric_name:	String		Name of the metric being run.
+            project:		String		JIRA project key being run.
+        """
+        self.unit_tags = ('metric:' + metric_name, 'jira_project:' + project)
+        try:
+            with self.timer('metric.duration'):
+                yield
+        finally:
+            self.unit_tags = ()
+
+    @contextlib.contextmanager
+    def timer(self, name, tags=()):
+        """Adds the wall time of the block to the named timing.
+
+        Args:
+            name:	String		Name appended to `jiradog.internal.`.
+            tags:	Tuple		Tags added to the current unit's.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_timing(name, time.time() - start, tags)
+
+    def reset(self):
+        """Forgets everything recorded, e.g. in a freshly forked worker."""
+        self.timings = {}
+        self.counters = {}
+        self.unit_tags = ()
+
+    def merge(self, timings, counters):
+        """Adds timings and counters recorded by another process.
+
+        Args:
+            timings:	Dictionary	Another instance's timings.
+            counters:	Dictionary	Another instance's counters.
+        """
+        for key, value in timings.iteritems():
+            self.timings[key] = self.timings.get(key, 0) + value
+        for key, value in counters.iteritems():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def add_timing(self, name, seconds, tags=()):
+        """Adds seconds to the named timing for the current unit, plus tags."""
+        key = (name, self.unit_tags + tuple(tags))
+        self.timings[key] = self.timings.get(key, 0) + seconds
+
+    def increment(self, name, value=1):
+        """Adds value to the named counter for the current unit."""
+        key = (name, self.unit_tags)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def payload(self, timestamp):
+        """Builds the Datadog payload for everything recorded.
+
+        Args:
+            timestamp:	Float		Timestamp to submit the points with.
+
+        Returns:
+            List of metric dictionaries, same format as the main payload.
+        """
+        payload = []
+        for (name, tags), value in sorted(self.timings.items()) + sorted(self.counters.items()):
+            payload.append({
+                'metric': 'jiradog.internal.' + name,
+                'points': (timestamp, value),
+                'tags': list(tags)
+                })
+        return payload
+
+    def profile(self):
+        """Builds a per-metric timing breakdown, slowest first.
+
+        Returns:
+            List of strings, one line per metric/project plus a header.
+        """
+        lines = ['%-50s %-12s %9s %9s %9s %6s %10s' % ('metric', 'project', 'total(s)',
+                                                       'query(s)', 'render(s)', 'pages',
+                                                       'changelogs')]
+        units = [(value, tags) for (name, tags), value in self.timings.items()
+                 if name == 'metric.duration']
+        for value, tags in sorted(units, reverse=True):
+            lines.append('%-50s %-12s %9.2f %9.2f %9.2f %6d %10d' % (
+                tags[0].split(':', 1)[1],
+                tags[1].split(':', 1)[1],
+                value,
+                self.timings.get(('query.duration', tags), 0),
+                self.timings.get(('template.duration', tags), 0),
+                self.counters.get(('jira.pages', tags), 0),
+                self.counters.get(('changelog.calls', tags), 0)))
+        return lines
+
+INSTRUMENTATION = Instrumentation()
+
+class Snapshot(object):
+    """Local dump of everything fetched from JIRA, to evaluate metrics offline.
+
+    The file is JSON-lines, each line prefixed with the record's kind and key:
+    `kind<TAB>key<TAB>json`. Only the prefixes are scanned when reading, the
+    JSON is parsed from the memory-mapped file when a record is looked up.
+    """
+    def __init__(self):
+        self.mode = None
+        self.path = None
+        self.snapshot_file = None
+        self.data = None
+        self.offsets = {}
+
+    def open_write(self, path):
+        """Starts recording everything fetched from JIRA to path.
+
+        The snapshot holds JIRA issue content, so only this user can read it.
+        """
+        self.mode = 'write'
+        self.path = path
+        snapshot_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        # The mode is only applied when the file is created.
+        os.fchmod(snapshot_fd, 0o600)
+        self.snapshot_file = os.fdopen(snapshot_fd, 'w')
+
+    def open_read(self, path):
+        """Indexes the records in path, JIRA is not called from here on."""
+        self.mode = 'read'
+        self.path = path
+        with open(path, 'rb') as snapshot_file:
+            if os.fstat(snapshot_file.fileno()).st_size == 0:
+                return
+            self.data = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = 0
+        line = self.data.readline()
+        while line:
+            kind, key = line.split('\t', 2)[:2]
+            self.offsets[(kind, key)] = offset
+            offset = self.data.tell()
+            line = self.data.readline()
+        logging.info('indexed %s records from snapshot %s', len(self.offsets), path)
+
+    def record(self, kind, key, value):
+        """Writes a record, if writing a snapshot.
+
+        Args:
+            kind:	String		One of 'search', 'sprints' or 'changelog'.
+            key:	String		Query hash, board id or issue key.
+            value:	List		JSON serializable data returned from JIRA.
+        """
+        if self.mode != 'write' or (kind, str(key)) in self.offsets:
+            return
+        self.offsets[(kind, str(key))] = self.snapshot_file.tell()
+        self.snapshot_file.write('%s\t%s\t%s\n' % (kind,
+                                                   key,
+                                                   json.dumps(value, separators=(',', ':'))))
+
+    def lookup(self, kind, key):
+        """Reads a record, exits if the snapshot doesn't have it.
+
+        Args:
+            kind:	String		One of 'search', 'sprints' or 'changelog'.
+            key:	String		Query hash, board id or issue key.
+
+        Returns:
+            The data that was recorded.
+        """
+        if (kind, str(key)) not in self.offsets:
+            logging.error("%s %s not found in snapshot %s, rerun with --snapshot-write",
+                          kind, key, self.path)
+            sys.exit(1)
+        self.data.seek(self.offsets[(kind, str(key))])
+        return json.loads(self.data.readline().split('\t', 2)[2])
+
+    def close(self):
+        """Closes the snapshot file."""
+        if self.snapshot_file is not None:
+            self.snapshot_file.close()
+        if self.data is not None:
+            self.data.close()
+
+SNAPSHOT = Snapshot()
+
+class Journal(object):
+    """Append-only record of a run's progress, to resume the run if it dies.
+
+    Uses the same `kind<TAB>key<TAB>json` lines as Snapshot. Journals are
+    named after a signature of the run's arguments and metric config, so runs
+    of different metrics never touch each other's journal, and are kept in a
+    directory private to the user running jiradog. The first line is the run
+    header. Completed metric/project results, search pages, changelogs and
+    sprints are synced to disk as each is fetched, so a run killed partway
+    through a search or by a pool worker exiting loses nothing it fetched.
+    Pool workers append to their own file next to the journal, `FILE.wN`.
+    """
+    def __init__(self):
+        self.path = None
+        self.lock_file = None
+        self.journal_file = None
+        self.data = []
+        self.offsets = {}
+
+    def open(self, directory, signature, now, resume=False):
+        """Starts journaling a run, picking up the last run's records if resuming.
+
+        Nothing is journaled if the directory isn't private to this user, or
+        if another run with the same signature holds the journal.
+
+        Args:
+            directory:		String		Directory for journals, created if missing.
+            signature:		String		Hash of the run's arguments and metric config.
+            now:		Float		Unix timestamp of this run.
+            resume:		Boolean		Resume from this run's journal, if there is one.
+
+        Returns:
+            Float of the unix timestamp of the run being resumed, or now.
+        """
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory, 0o700)
+            directory_stat = os.stat(directory)
+        except OSError as error:
+            logging.warning('can not use journal directory, not journaling: %s', error)
+            return now
+        if directory_stat.st_uid != os.getuid() or directory_stat.st_mode & 0o077:
+            logging.warning('journal directory %s is not private to this user, not journaling',
+                            directory)
+            return now
+        path = os.path.join(directory, 'jiradog-' + signature + '.journal')
+        lock_file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600), 'a+')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            logging.warning('journal %s is held by another run, not journaling', path)
+            lock_file.close()
+            return now
+        self.path = path
+        self.lock_file = lock_file
+        self.journal_file = lock_file
+        paths = [path] + sorted(glob.glob(path + '.w*'))
+        lock_file.seek(0)
+        header = lock_file.readline()
+        header = header.rstrip('\n').split('\t', 2) if header.endswith('\n') else []
+        if resume and header[:2] == ['run', signature]:
+            for index, journal_path in enumerate(paths):
+                self.index(index, journal_path)
+            logging.info('resuming run from journal %s, %s records', path, len(self.offsets))
+            return json.loads(header[2])['now']
+        if resume:
+            logging.warning('no journal at %s to resume from, starting over', path)
+        lock_file.truncate(0)
+        for journal_path in paths[1:]:
+            os.remove(journal_path)
+        self.record('run', signature, {'now': now})
+        return now
+
+    def index(self, index, path):
+        """Indexes the records in one journal file.
+
+        Args:
+            index:	Integer		Position of the file's data in self.data.
+            path:	String		Journal file.
+        """
+        with open(path, 'r+b') as journal_file:
+            # A run killed mid-write leaves a partial last line, which would
+            # run into the next record appended.
+            size = os.fstat(journal_file.fileno()).st_size
+            if size > 0:
+                data = mmap.mmap(journal_file.fileno(), 0, access=mmap.ACCESS_READ)
+                end = data.rfind('\n') + 1
+                if end < size:
+                    data.close()
+                    journal_file.truncate(end)
+                    size = end
+            if size == 0:
+                self.data.append(None)
+                return
+            data = mmap.mmap(journal_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data.append(data)
+        offset = 0
+        line = data.readline()
+        while line:
+            kind, key = line.split('\t', 2)[:2]
+            if kind != 'run':
+                self.offsets.setdefault((kind, key), []).append((index, offset))
+            offset = data.tell()
+            line = data.readline()
+
+    def fork(self, worker):
+        """Switches to the worker's own journal file, in a pool worker.
+
+        Args:
+            worker:	Integer		Worker index.
+        """
+        if self.journal_file is not None:
+            self.journal_file = os.fdopen(os.open(self.path + '.w' + str(worker),
+                                                  os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                                                  0o600), 'a')
+
+    def record(self, kind, key, value):
+        """Appends a record and syncs it to disk, if journaling.
+
+        Args:
+            kind:	String		One of 'run', 'unit', 'page', 'changelog' or 'sprints'.
+            key:	String		Signature, metric/project, query hash, issue key or board id.
+            value:	Object		JSON serializable data.
+        """
+        if self.journal_file is None:
+            return
+        self.journal_file.write('%s\t%s\t%s\n' % (kind,
+                                                   key,
+                                                   json.dumps(value, separators=(',', ':'))))
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+
+    def lookup(self, kind, key):
+        """Reads the records a resumed run left for kind and key.
+
+        Args:
+            kind:	String		One of 'unit', 'page', 'changelog' or 'sprints'.
+            key:	String		Metric/project, query hash, issue key or board id.
+
+        Returns:
+            List of the data recorded, in the order it was recorded per file.
+        """
+        values = []
+        for index, offset in self.offsets.get((kind, str(key)), []):
+            self.data[index].seek(offset)
+            values.append(json.loads(self.data[index].readline().split('\t', 2)[2]))
+        return values
+
+    def remove(self):
+        """Closes and deletes the journal, once the run has succeeded."""
+        if self.path is None:
+            return
+        paths = [self.path] + glob.glob(self.path + '.w*')
+        self.close()
+        for path in paths:
+            os.remove(path)
+        self.path = None
+
+    def close(self):
+        """Closes the journal files, releasing the journal to other runs."""
+        if self.journal_file is not None and self.journal_file is not self.lock_file:
+            self.journal_file.close()
+        if self.lock_file is not None:
+            self.lock_file.close()
+        self.journal_file = None
+        self.lock_file = None
+        for data in self.data:
+            if data is not None:
+                data.close()
+        self.data = []
+        self.offsets = {}
+
+JOURNAL = Journal()
+
+class RateLimiter(object):
+    """Token bucket every JIRA call in the process goes through.
+
+    Tokens refill at `rate` per second up to `burst`. A throttled call (429)
+    halves the rate and blocks every call until its Retry-After has passed;
+    each successful call then climbs the rate back towards the configured one.
+    """
+    def __init__(self, rate=10, burst=10, max_retries=5):
+        self.max_rate = None
+        self.rate = None
+        self.burst = None
+        self.tokens = None
+        self.max_retries = None
+        self.updated = time.time()
+        self.blocked_until = 0
+        self.configure(rate, burst, max_retries)
+
+    def configure(self, rate, burst=None, max_retries=5):
+        """Sets the limits, e.g. from the config file.
+
+        Args:
+            rate:		Float		Sustained JIRA calls per second.
+            burst:		Integer		Calls allowed at once after being idle, defaults to rate.
+            max_retries:	Integer		Retries of a throttled call before giving up.
+        """
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.tokens = self.burst
+        self.max_retries = max_retries
+
+    def acquire(self):
+        """Blocks until a call can be made."""
+        with INSTRUMENTATION.timer('ratelimit.wait.duration'):
+            while True:
+                now = time.time()
+                if now < self.blocked_until:
+                    time.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens = self.tokens - 1
+                    return
+                time.sleep((1 - self.tokens) / self.rate)
+
+    def throttled(self, retry_after=None):
+        """Backs off after JIRA refused a call for going too fast.
+
+        Args:
+            retry_after:	Float		Seconds JIRA asked to wait, if it did.
+        """
+        INSTRUMENTATION.increment('jira.throttled')
+        self.rate = max(self.rate / 2, self.max_rate / 64)
+        self.tokens = 0
+        if retry_after is None:
+            retry_after = 1 / self.rate
+        logging.warning("JIRA throttled the request, waiting %.1fs and slowing to %.2f calls/s",
+                        retry_after, self.rate)
+        self.blocked_until = max(self.blocked_until, time.time() + retry_after)
+
+    def succeeded(self):
+        """Climbs the rate back towards the configured rate."""
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+RATE_LIMITER = RateLimiter()
+
+def retry_after_seconds(retry_after):
+    """Converts a Retry-After header to seconds.
+
+    Args:
+        retry_after:	String		Header value, either seconds or an HTTP date.
+
+    Returns:
+        Float of seconds to wait, None if the header is missing or malformed.
+    """
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0)
+    except ValueError:
+        retry_date = email.utils.parsedate_tz(retry_after)
+        if retry_date is None:
+            return None
+        return max(email.utils.mktime_tz(retry_date) - time.time(), 0)
+
+def rate_limited(function, *args, **kwargs):
+    """Calls the JIRA SDK through RATE_LIMITER, retrying throttled calls.
+
+    Args:
+        function:	Function	JIRA SDK method or constructor.
+        args, kwargs:			Passed on to function.
+
+    Returns:
+        What function returns.
+    """
+    retries = 0
+    while True:
+        RATE_LIMITER.acquire()
+        try:
+            result = function(*args, **kwargs)
+        except JIRAError as error:
+            if error.status_code != 429 or retries >= RATE_LIMITER.max_retries:
+                raise
+            retries = retries + 1
+            RATE_LIMITER.throttled(retry_after_seconds(error.response.headers.get('Retry-After')
+                                                       if error.response is not None else None))
+            continue
+        RATE_LIMITER.succeeded()
+        return result
+
+def jira_get(url, auth):
+    """GETs a JIRA REST API url through RATE_LIMITER, retrying throttled calls.
+
+    Args:
+        url:	String		Full url of the REST call.
+        auth:	Tuple		JIRA api username and password.
+
+    Returns:
+        requests Response object.
+    """
+    retries = 0
+    while True:
+        RATE_LIMITER.acquire()
+        response = requests.get(url, auth=auth)
+        if response.status_code != 429 or retries >= RATE_LIMITER.max_retries:
+            break
+        retries = retries + 1
+        RATE_LIMITER.throttled(retry_after_seconds(response.headers.get('Retry-After')))
+    if response.status_code != 429:
+        RATE_LIMITER.succeeded()
+    return response
+
+# Compiled jinja2 templates by their source, filters are rendered once per issue.
+TEMPLATES = {}
+
+def compile_template(source):
+    """Compiles a jinja2 template string, once per run.
+
+    Args:
+        source:		String		jinja2 template.
+
+    Returns:
+        jinja2 Template object.
+    """
+    if source not in TEMPLATES:
+        TEMPLATES[source] = jinja2.Template(source)
+    return TEMPLATES[source]
+
+def render_template(source, **kwargs):
+    """Renders a jinja2 template string, timing the render.
+
+    Args:
+        source:		String		jinja2 template.
+        kwargs:				Variables passed to the template.
+
+    Returns:
+        Unicode string of the rendered template.
+    """
+    with INSTRUMENTATION.timer('template.duration'):
+        return compile_template(source).render(**kwargs)
+
 class JiraProvider(object):
     """Group of functions/methods to get/manipulate JIRA data
 
     Returns:
         List of issues.
     """
+    # Largest search page asked for while the server's cap is unknown.
+    max_page_size = 1000
+
     def __init__(self, api_url, api_username, api_password):
-        self.jira = JIRA(api_url, basic_auth=(api_username, api_password))
+        self.api_url = api_url
+        self.api_username = api_username
+        self.api_password = api_password
+        self._jira = None
+        # Search page size, grown until the server caps it, then kept at the cap.
+        self.page_size = 100
+        self.page_cap = None
+
+    @property
+    def jira(self):
+        """JIRA SDK connection, only made once it's needed."""
+        if self._jira is None:
+            self._jira = rate_limited(JIRA,
+                                      self.api_url,
+                                      basic_auth=(self.api_username, self.api_password))
+        return self._jira
 
     def get_issues(self, metric_data_loaded, position, project):
         """Using the JIRA SDK, gets a list of issues.
@@ -66,8 +639,6 @@ class JiraProvider(object):
         Returns:
             List of issues returned from JIRA JQL query.
         """
-        max_results = 100
-        start_at = max_results
         issues = []
         cache = {}
         ## If/then statement failed, so I want to find  ##
@@ -77,43 +648,122 @@ class JiraProvider(object):
             sprint_ids = self.get_sprints(metric_data_loaded, API_USERNAME, API_PASSWORD, project)
             queries = []
             for key, value in sprint_ids.iteritems():
-                jql = jinja2.Template(metric_data_loaded \
-                                      [position] \
-                                      ['jql']).render(project=project,
-                                                      metric=metric_data_loaded,
-                                                      sprint_id=key,
-                                                      sprint_end_date=value)
-                queries.append(jinja2.Template(jql).render(project=project,
-                                                           sprint_id=key,
-                                                           sprint_end_date=value))
+                queries.append(self.render_jql(metric_data_loaded,
+                                               position,
+                                               project,
+                                               sprint_id=key,
+                                               sprint_end_date=value))
         else:
-            jql = jinja2.Template(metric_data_loaded \
-                                  [position] \
-                                  ['jql']).render(project=project,
-                                                  metric=metric_data_loaded)
-            queries = [jinja2.Template(jql).render(project=project)]
+            queries = [self.render_jql(metric_data_loaded, position, project)]
         for query in queries:
             jql_sha512 = hashlib.sha512(query).hexdigest()
             if cache.get(jql_sha512, False):
                 logging.info("Using cached version of query and results")
+                INSTRUMENTATION.increment('cache.hits')
                 issues = cache[jql_sha512]
             else:
                 logging.info("Adding query and results to cache")
-                search = self.jira.search_issues(query, maxResults=max_results, startAt=0)
-                for issue in search:
+                INSTRUMENTATION.increment('cache.misses')
+                for issue in self.search_issues(query, jql_sha512):
                     issues.append(issue)
-                while len(search) == max_results:
-                    search = self.jira.search_issues(query,
-                                                     maxResults=max_results,
-                                                     startAt=start_at)
-                    for issue in search:
-                        issues.append(issue)
-                    start_at = start_at + max_results
                 if metric_data_loaded.get(position, False).get('filter', False) is not False:
                     issues = self.filter_issues(metric_data_loaded, issues, position)
                 cache[jql_sha512] = issues
         return issues
 
+    @classmethod
+    def render_jql(cls, metric_data_loaded, position, project, **sprint):
+        """Renders a data provider's jql, which may itself render to jinja2.
+
+        Args:
+            metric_data_loaded:	Dictionary	JSON object from the metric config block.
+            position:		String		Either 'numerator' or 'denominator'.
+            project:		String		The project to templatize the jql.
+            sprint:				sprint_id and sprint_end_date, if grouped by sprint.
+
+        Returns:
+            String of the JQL query.
+        """
+        jql = render_template(metric_data_loaded[position]['jql'],
+                              project=project,
+                              metric=metric_data_loaded,
+                              **sprint)
+        return render_template(jql, project=project, **sprint)
+
+    def search_issues(self, query, jql_sha512):
+        """Runs a JQL query through every page of results.
+
+        Args:
+            query:		String		Rendered JQL query.
+            jql_sha512:		String		Hash of the query, used as the snapshot and journal key.
+
+        Returns:
+            List of issues returned from JIRA JQL query.
+        """
+        if SNAPSHOT.mode == 'read':
+            return [self.issue_from_raw(raw) for raw in SNAPSHOT.lookup('search', jql_sha512)]
+        start_at = 0
+        issues = []
+        last_page = False
+        # Pages already fetched by the run being resumed. The same query may
+        # have been paged more than once with different page sizes, so pages
+        # are followed from one start_at to the next.
+        pages = dict((page['start_at'], page) for page in JOURNAL.lookup('page', jql_sha512))
+        while start_at in pages and not last_page:
+            issues.extend([self.issue_from_raw(raw) for raw in pages[start_at]['issues']])
+            last_page = pages[start_at]['last']
+            start_at = start_at + len(pages[start_at]['issues'])
+        query_start = time.time()
+        with INSTRUMENTATION.timer('query.duration'):
+            while not last_page:
+                search = rate_limited(self.jira.search_issues,
+                                      query,
+                                      maxResults=self.page_size,
+                                      startAt=start_at)
+                INSTRUMENTATION.increment('jira.pages')
+                for issue in search:
+                    issues.append(issue)
+                page_start_at = start_at
+                start_at = start_at + len(search)
+                # The server answers with the page size it actually used.
+                page_size = getattr(search, 'maxResults', None) or self.page_size
+                last_page = len(search) == 0 or len(search) < page_size
+                if getattr(search, 'total', None) is not None:
+                    last_page = len(search) == 0 or start_at >= search.total
+                if page_size < self.page_size:
+                    logging.info("JIRA caps search pages at %s results", page_size)
+                    self.page_cap = page_size
+                    self.page_size = page_size
+                elif self.page_cap is None:
+                    self.page_size = min(self.page_size * 2, self.max_page_size)
+                if JOURNAL.journal_file is not None:
+                    JOURNAL.record('page', jql_sha512, {
+                        'start_at': page_start_at,
+                        'last': last_page,
+                        'issues': [issue.raw for issue in search]
+                        })
+        # Per query as well as per unit, to find the slow JQL among a unit's queries.
+        query_duration = time.time() - query_start
+        INSTRUMENTATION.add_timing('query.jql.duration',
+                                   query_duration,
+                                   ('jql:' + jql_sha512[:16],))
+        logging.info('query jql:%s took %.2fs: %s', jql_sha512[:16], query_duration, query)
+        if SNAPSHOT.mode == 'write':
+            SNAPSHOT.record('search', jql_sha512, [issue.raw for issue in issues])
+        return issues
+
+    @classmethod
+    def issue_from_raw(cls, raw):
+        """Builds a JIRA SDK issue from its raw JSON, without connecting to JIRA.
+
+        Args:
+            raw:	Dictionary	Issue JSON, as returned by the REST API.
+
+        Returns:
+            JIRA SDK issue object.
+        """
+        return Issue({}, None, raw=raw)
+
     @classmethod
     def filter_issues(cls, metric_data_loaded, issues, position):
         """Filters issues based on jinja2 format if/then statement.
@@ -128,11 +778,10 @@ class JiraProvider(object):
         """
         filtered_issues = []
         for issue in issues:
-            if jinja2.Template(jinja2.Template(metric_data_loaded
-                                               [position]
-                                               ['filter']).render(issue=issue,
-                                                                  metric=metric_data_loaded)
-                              ).render(issue=issue) == u'true':
+            if render_template(render_template(metric_data_loaded[position]['filter'],
+                                               issue=issue,
+                                               metric=metric_data_loaded),
+                               issue=issue) == u'true':
                 filtered_issues.append(issue)
         return filtered_issues
 
@@ -150,48 +799,42 @@ class JiraProvider(object):
             List of integers that are the ids of JIRA sprints.
         """
         sprints = []
-        sprint_ids = []
         sprint_ids_with_end_date = {}
-        max_results = 50
-        start_at = max_results
-        url = 'https://evernote.jira.com/rest/agile/1.0/board/' + \
-              metric_data_loaded['grouping']['boards'][project] + \
-              '/sprint?maxResults=' + \
-              str(max_results)
-        search_request = requests.get(url,
-                                      auth=(api_username,
-                                            api_password))
-        search = json.loads(search_request.text)
-
-        if search_request.status_code == 200:
+        board = metric_data_loaded['grouping']['boards'][project]
+        journaled = JOURNAL.lookup('sprints', board)
+        if SNAPSHOT.mode == 'read':
+            sprints = SNAPSHOT.lookup('sprints', board)
+        elif journaled:
+            sprints = journaled[-1]
+        else:
+            max_results = 50
+            url = 'https://evernote.jira.com/rest/agile/1.0/board/' + \
+                  board + \
+                  '/sprint?maxResults=' + \
+                  str(max_results)
+            search = cls.get_page(url, api_username, api_password)
             for sprint in search['values']:
                 if sprint.get('endDate', False) is not False:
                     sprints.append(sprint)
-                    sprint_ids.append(sprint['id'])
-            while search['isLast'] is False:
-                search = json.loads(requests.get(url + '&startAt=' + str(start_at),
-                                                 auth=(API_USERNAME,
-                                                       API_PASSWORD)).text)
+            while search['isLast'] is False and search['values']:
+                start_at = search['startAt'] + len(search['values'])
+                search = cls.get_page(url + '&startAt=' + str(start_at),
+                                      api_username,
+                                      api_password)
                 for sprint in search['values']:
                     if sprint.get('endDate', False) is not False:
                         sprints.append(sprint)
-                        sprint_ids.append(sprint['id'])
-                start_at = start_at + max_results
-            sprint_ids.sort(key=int)
-            for sprint in sprints:
-                if sprint['id'] in sprint_ids[int(metric_data_loaded['grouping']['count']):]:
-                    sprint_ids_with_end_date[str(sprint
-                                                 ['id'])] = time.strftime('%Y-%m-%d %I:%M',
-                                                                          pretty_date(sprint
-                                                                                      ['endDate']))
-            return sprint_ids_with_end_date
-        else:
-            logging.error("API call did not return 200 (OK). HTTP Code: " + \
-                          str(search_request.status_code) + \
-                          "; URL: " + \
-                          url + \
-                          "; Result: " + \
-                          search)
+            SNAPSHOT.record('sprints', board, sprints)
+            JOURNAL.record('sprints', board, sprints)
+        sprint_ids = [sprint['id'] for sprint in sprints]
+        sprint_ids.sort(key=int)
+        for sprint in sprints:
+            if sprint['id'] in sprint_ids[int(metric_data_loaded['grouping']['count']):]:
+                sprint_ids_with_end_date[str(sprint
+                                             ['id'])] = time.strftime('%Y-%m-%d %I:%M',
+                                                                      pretty_date(sprint
+                                                                                  ['endDate']))
+        return sprint_ids_with_end_date
 
     @classmethod
     def get_issue_changelog(cls, server_url, api_username, api_password, issue_key):
@@ -210,53 +853,79 @@ class JiraProvider(object):
         Returns:
             Dictionary of issue history.
         """
+        INSTRUMENTATION.increment('changelog.calls')
+        if SNAPSHOT.mode == 'read':
+            return SNAPSHOT.lookup('changelog', issue_key)
+        journaled = JOURNAL.lookup('changelog', issue_key)
+        if journaled:
+            return journaled[-1]
         max_results = 100
-        start_at = 100
         issue_url = server_url + \
                     "/rest/api/2/issue/" + \
                     issue_key + \
                     "/changelog?maxResults=" + \
                     str(max_results)
-        changelog_json = json.loads(requests.get(issue_url,
-                                                 auth=(api_username,
-                                                       api_password)).text)
+        changelog_json = cls.get_page(issue_url, api_username, api_password)
         changelog = changelog_json['values']
-        while changelog_json['isLast'] is False:
-            changelog_json = json.loads(requests.get(issue_url + \
-                                                     "&startAt=" + \
-                                                     str(start_at),
-                                                     auth=(api_username,
-                                                           api_password)).text)
-            for change in changelog_json:
+        while changelog_json['isLast'] is False and changelog_json['values']:
+            start_at = changelog_json['startAt'] + len(changelog_json['values'])
+            changelog_json = cls.get_page(issue_url + "&startAt=" + str(start_at),
+                                          api_username,
+                                          api_password)
+            for change in changelog_json['values']:
                 changelog.append(change)
-            start_at = start_at + max_results
+        SNAPSHOT.record('changelog', issue_key, changelog)
+        JOURNAL.record('changelog', issue_key, changelog)
         return changelog
 
-def mean_time_between_statuses(metric_data_loaded, position, issue):
+    @classmethod
+    def get_page(cls, url, api_username, api_password):
+        """Gets a page from the JIRA REST API, raises if JIRA returns an error.
+
+        Args:
+            url:		String	REST API url, including paging parameters.
+            api_username:	String	Username for JIRA API.
+            api_password:	String	Password for JIRA API.
+
+        Returns:
+            Dictionary of the page.
+        """
+        page_request = jira_get(url, (api_username, api_password))
+        INSTRUMENTATION.increment('jira.pages')
+        if page_request.status_code != 200:
+            logging.error("API call did not return 200 (OK). HTTP Code: " + \
+                          str(page_request.status_code) + \
+                          "; URL: " + \
+                          url + \
+                          "; Result: " + \
+                          page_request.text)
+            raise requests.HTTPError("API call did not return 200 (OK). HTTP Code: " + \
+                                     str(page_request.status_code),
+                                     response=page_request)
+        return json.loads(page_request.text)
+
+def mean_time_between_statuses(metric_data_loaded, position, issue, changelog=None):
     """Calculates the length of time between two statuses in an issue.
 
     Args:
         metric_data_loaded:	Dictionary	The metric configuration JSON block.
         position:           String		Either 'numerator' or 'denominator'.
         issue:              Dictionary	JIRA object of the issue.
+        changelog:          List		The issue's changelog, fetched from JIRA if not given.
 
     Returns:
         Floating point number in days
     """
+    if changelog is None and 'changelog' in [status['source'] for status
+                                             in metric_data_loaded[position]['statuses'][:2]]:
+        changelog = JP.get_issue_changelog(API_URL, API_USERNAME, API_PASSWORD, issue.key)
     if metric_data_loaded[position]['statuses'][0]['source'] == "issue":
-        first_date = jinja2.Template(metric_data_loaded \
-                                     [position] \
-                                     ['statuses'] \
-                                     [0] \
-                                     ['date']).render(issue=issue)
+        first_date = render_template(metric_data_loaded[position]['statuses'][0]['date'],
+                                     issue=issue)
     elif metric_data_loaded[position]['statuses'][0]['source'] == "changelog":
-        changelog = JP.get_issue_changelog(API_URL, API_USERNAME, API_PASSWORD, issue.key)
         try:
-            first_date = jinja2.Template(metric_data_loaded \
-                                         [position] \
-                                         ['statuses'] \
-                                         [0] \
-                                         ['date']).render(changelog=changelog)
+            first_date = render_template(metric_data_loaded[position]['statuses'][0]['date'],
+                                         changelog=changelog)
         except:
             # Find exact exception here and specify
             logging.info("first_date: didn't find what we were looking for in the changelog, " + \
@@ -264,21 +933,14 @@ def mean_time_between_statuses(metric_data_loaded, position, issue):
             first_date = str("")
 
         if str(first_date) == "":
-            first_date = jinja2.Template("{{issue.fields.created}}").render(issue=issue)
+            first_date = render_template("{{issue.fields.created}}", issue=issue)
     if metric_data_loaded[position]['statuses'][1]['source'] == "issue":
-        second_date = jinja2.Template(metric_data_loaded \
-                                      [position] \
-                                      ['statuses'] \
-                                      [1] \
-                                      ['date']).render(issue=issue)
+        second_date = render_template(metric_data_loaded[position]['statuses'][1]['date'],
+                                      issue=issue)
     elif metric_data_loaded[position]['statuses'][1]['source'] == "changelog":
-        changelog = JP.get_issue_changelog(API_URL, API_USERNAME, API_PASSWORD, issue.key)
         try:
-            second_date = jinja2.Template(metric_data_loaded \
-                                          [position] \
-                                          ['statuses'] \
-                                          [1] \
-                                          ['date']).render(changelog=changelog)
+            second_date = render_template(metric_data_loaded[position]['statuses'][1]['date'],
+                                          changelog=changelog)
         except:
             # Find exact exception here and specify
             logging.info("second_date: didn't find what we were looking for in the changelog, " + \
@@ -286,7 +948,7 @@ def mean_time_between_statuses(metric_data_loaded, position, issue):
             second_date = str("")
 
         if str(second_date) == "":
-            second_date = jinja2.Template("{{issue.fields.created}}").render(issue=issue)
+            second_date = render_template("{{issue.fields.created}}", issue=issue)
 
     return (time.mktime(pretty_date(second_date)) - \
             time.mktime(pretty_date(first_date))) / \
@@ -322,39 +984,729 @@ def custom_field_sum(issues, custom_field):
                                          getattr(issue.fields, custom_field)
     return custom_field_running_total
 
-def load_metric_file(metric_file, metrics):
+def file_signature(path):
+    """Modification time and size of a file, to tell if it changed.
+
+    Args:
+        path:	String		File location, may be None.
+
+    Returns:
+        List of the mtime and size, None if path is None.
+    """
+    if path is None:
+        return None
+    path_stat = os.stat(path)
+    return [path_stat.st_mtime, path_stat.st_size]
+
+def index_metrics(metric_file_full, metric_file):
+    """Indexes metric config blocks by name, exits on duplicate names.
+
+    Args:
+        metric_file_full:	List		Metric configuration JSON blocks.
+        metric_file:		String		The file location for metrics.json.
+
+    Returns:
+        Dictionary of metric config blocks by metric_name.
+    """
+    metric_index = {}
+    for metric in metric_file_full:
+        if metric['metric_name'] in metric_index:
+            logging.error("%s is defined more than once in %s", metric['metric_name'], metric_file)
+            sys.exit(1)
+        metric_index[metric['metric_name']] = metric
+    return metric_index
+
+def schema_error(error):
+    """Picks the schema validation error that explains what is wrong.
+
+    A data provider matches one branch of a oneOf per source. Rather than
+    the oneOf itself, report why the branch for the provider's source failed,
+    e.g. a jira provider missing its jql.
+
+    Args:
+        error:	Object		jsonschema.ValidationError raised by validation.
+
+    Returns:
+        The jsonschema.ValidationError to report.
+    """
+    if error.validator != 'oneOf' or not error.context:
+        return error
+    branches = {}
+    for branch_error in error.context:
+        branches.setdefault(branch_error.relative_schema_path[0], []).append(branch_error)
+    matching = [branch_errors for branch_errors in branches.values()
+                if not any(list(branch_error.relative_path) == ['source']
+                           for branch_error in branch_errors)]
+    if len(matching) == 1:
+        return schema_error(matching[0][0])
+    return error
+
+def validate_metric_file(metric_file_full, metric_file, schema_file):
+    """Validates metrics.json against its schema and compiles its templates.
+
+    Exits on the first error, before anything is fetched from JIRA.
+
+    Args:
+        metric_file_full:	List		Metric configuration JSON blocks.
+        metric_file:		String		The file location for metrics.json.
+        schema_file:		String		The file location for metrics.schema.json.
+    """
+    with open(schema_file) as schema_file_loaded:
+        schema = json.load(schema_file_loaded)
+    validator = jsonschema.validators.validator_for(schema)
+    validator.check_schema(schema)
+    # Not jsonschema.validate, its pick of the errors descends into the wrong oneOf branch.
+    for error in sorted(validator(schema).iter_errors(metric_file_full),
+                        key=lambda error: list(error.absolute_path)):
+        error = schema_error(error)
+        logging.error("%s does not match %s at %s: %s",
+                      metric_file,
+                      schema_file,
+                      '/'.join(str(part) for part in error.absolute_path),
+                      error.message)
+        sys.exit(1)
+    for metric in metric_file_full:
+        for position in ['issues', 'numerator', 'denominator']:
+            data_provider = metric.get(position, {})
+            templates = [data_provider.get('jql'), data_provider.get('filter')]
+            templates.extend(data_provider.get('backfill', {}).values())
+            templates.extend(status['date'] for status in data_provider.get('statuses', []))
+            for template in templates:
+                if template is None:
+                    continue
+                try:
+                    compile_template(template)
+                except jinja2.TemplateSyntaxError as error:
+                    logging.error("%s %s has a malformed template: %s",
+                                  metric['metric_name'],
+                                  position,
+                                  error)
+                    sys.exit(1)
+
+def load_metric_file(metric_file, metrics, schema_file=None, cache_file=None):
     """Created python dictionary from metrics.json file.
 
+    If schema_file is given, the file is validated against it. If cache_file is
+    given, the validated file is cached there as JSON and reused until
+    metrics.json or the schema are modified. A cache that isn't owned by the
+    user running jiradog, or that others can write to, is ignored.
+
     Args:
         metric_file:		String		The file location for metrics.json.
-        is_args_metric_set:	Boolean		Specifies if the entire file is to be loaded
-                           			(False) or a single metric by name (True)
+        metrics:		List		Names of the metrics to load, all if empty.
+        schema_file:		String		The file location for metrics.schema.json.
+        cache_file:		String		The file location for the validated cache.
 
     Returns:
-        Dictionary of the values in the metrics.json file.
+        List of the metric config blocks, in requested order if metrics is set.
     """
-    with open(metric_file) as metric_file_loaded:
+    metric_file_full = None
+    if cache_file is not None:
+        cache_key = [file_signature(metric_file), file_signature(schema_file)]
         try:
-            metric_file_full = json.load(metric_file_loaded)
-        except ValueError:
-            logging.error("%s is not properly formatted using the JSON spacification", METRIC_JSON)
-            sys.exit(1)
-    metric_configs = metric_file_full
-    if metrics:
-        metric_configs = []
-        for requested_metric in metrics:
-            for metric in metric_file_full:
-                if requested_metric == metric['metric_name']:
-                    metric_configs.append(metric)
+            with open(cache_file) as cache_file_loaded:
+                cache_stat = os.fstat(cache_file_loaded.fileno())
+                if cache_stat.st_uid != os.getuid() or cache_stat.st_mode & 0o022:
+                    raise IOError('%s is not private to this user' % cache_file)
+                cache = json.load(cache_file_loaded)
+            if cache['key'] == cache_key:
+                metric_file_full = cache['metrics']
+                logging.info("using validated metric config from %s", cache_file)
+        except (IOError, ValueError, KeyError, TypeError) as error:
+            logging.info("no usable metric config cache at %s: %s", cache_file, error)
+
+    if metric_file_full is None:
+        with open(metric_file) as metric_file_loaded:
+            try:
+                metric_file_full = json.load(metric_file_loaded)
+            except ValueError:
+                logging.error("%s is not properly formatted using the JSON spacification",
+                              metric_file)
+                sys.exit(1)
+        if schema_file is not None:
+            validate_metric_file(metric_file_full, metric_file, schema_file)
+        if cache_file is not None:
+            # Written aside and renamed, so concurrent runs never read half a cache.
+            cache_file_new = cache_file + '.' + str(os.getpid())
+            try:
+                if not os.path.isdir(os.path.dirname(cache_file)):
+                    os.makedirs(os.path.dirname(cache_file), 0o700)
+                with os.fdopen(os.open(cache_file_new,
+                                       os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                                       0o600), 'w') as cache_file_loaded:
+                    json.dump({'key': cache_key, 'metrics': metric_file_full},
+                              cache_file_loaded)
+                os.rename(cache_file_new, cache_file)
+            except (IOError, OSError) as error:
+                logging.warning("could not write metric config cache: %s", error)
+                if os.path.exists(cache_file_new):
+                    os.remove(cache_file_new)
+
+    metric_index = index_metrics(metric_file_full, metric_file)
+    if not metrics:
+        return metric_file_full
+    metric_configs = []
+    for requested_metric in metrics:
+        if requested_metric in metric_index:
+            metric_configs.append(metric_index[requested_metric])
+        else:
+            logging.warning("%s is not defined in %s", requested_metric, metric_file)
     return metric_configs
 
 
+def evaluate_metric(metric_data_loaded, project, get_issues=None, changelogs=None):
+    """Runs a single metric config for a single project.
+
+    Args:
+        metric_data_loaded:	Dictionary	The metric configuration JSON block.
+        project:		String		JIRA project key.
+        get_issues:		Function	Returns the issues for a data provider,
+                       				defaults to JP.get_issues.
+        changelogs:		Dictionary	Issue changelogs by issue key. Changelogs
+                       				fetched from JIRA are added to it.
+
+    Returns:
+        Number to submit as the metric's point.
+    """
+    if get_issues is None:
+        get_issues = JP.get_issues
+    if changelogs is None:
+        changelogs = {}
+    numbers = []
+    total_time_between_statuses = 0
+    if metric_data_loaded['method'] == 'average':
+        ## Find the average from data providers.
+        logging.info('method: %s', metric_data_loaded['method'])
+
+        for position in ['numerator', 'denominator']:
+            if metric_data_loaded[position]['source'] == 'jira':
+
+                ## Get's list of issues from JIRA SDK
+                issues = get_issues(metric_data_loaded, position, project)
+
+                if metric_data_loaded[position]['method'] == 'ticket_count':
+                    numbers.append(len(issues))
+                elif metric_data_loaded[position]['method'] == 'custom_field_sum':
+                    numbers.append(custom_field_sum(issues,
+                                                    metric_data_loaded[position]['field']))
+                elif metric_data_loaded[position]['method'] == 'mean_time_between_statuses':
+                    uses_changelog = 'changelog' in [status['source'] for status in
+                                                     metric_data_loaded[position]['statuses'][:2]]
+                    for issue in issues:
+                        if uses_changelog and issue.key not in changelogs:
+                            changelogs[issue.key] = JP.get_issue_changelog(API_URL,
+                                                                           API_USERNAME,
+                                                                           API_PASSWORD,
+                                                                           issue.key)
+                        m_t = mean_time_between_statuses(metric_data_loaded,
+                                                         position,
+                                                         issue,
+                                                         changelogs.get(issue.key))
+                        total_time_between_statuses = total_time_between_statuses + m_t
+                    numbers.append(total_time_between_statuses)
+            elif metric_data_loaded[position]['source'] == 'constant':
+                numbers.append(metric_data_loaded[position]['data'][project])
+
+            if len(numbers) == 2:
+                if float(numbers[1]) != 0:
+                    points = float(numbers[0]) / float(numbers[1])
+                else:
+                    points = 0
+
+    elif metric_data_loaded['method'] == 'direct':
+        issues = get_issues(metric_data_loaded, 'issues', project)
+        if metric_data_loaded['issues']['method'] == 'ticket_count':
+            points = len(issues)
+    return points
+
+# Attributes naming a field value to group by, in order: names of users on
+# JIRA Server, components, versions and priorities; custom field options;
+# then user keys, JIRA Cloud account ids and display names.
+GROUP_ATTRIBUTES = ['name', 'value', 'key', 'accountId', 'displayName']
+
+def group_values(issue, field):
+    """Gets the values of an issue field to group the issue by.
+
+    Args:
+        issue:	Object		Issue from the JIRA SDK.
+        field:	String		Issue field name, e.g. assignee or customfield_10000.
+
+    Returns:
+        List of strings, one per value for list fields like components, 'none'
+        if unset. Values that can't be named are logged and left out.
+    """
+    value = getattr(issue.fields, field, None)
+    values = value if isinstance(value, list) else [value]
+    if not values:
+        values = [None]
+    names = []
+    for value in values:
+        if value is None:
+            names.append('none')
+        elif isinstance(value, (basestring, int, float)):
+            names.append(unicode(value))
+        else:
+            for attribute in GROUP_ATTRIBUTES:
+                if getattr(value, attribute, None):
+                    names.append(unicode(getattr(value, attribute)))
+                    break
+            else:
+                logging.warning('%s %s has no %s to group by, leaving it out',
+                                issue.key,
+                                field,
+                                '/'.join(GROUP_ATTRIBUTES))
+    return names
+
+def group_issues(issues, group_by):
+    """Partitions issues by the values of the group_by fields.
+
+    An issue with several values in a list field lands in each of their groups.
+
+    Args:
+        issues:		List		Issues from the JIRA SDK.
+        group_by:	List		Issue field names to group by.
+
+    Returns:
+        Dictionary of issue lists by tuple of field:value tags.
+    """
+    groups = {}
+    for issue in issues:
+        tags = [[field + ':' + value for value in group_values(issue, field)]
+                for field in group_by]
+        for group in itertools.product(*tags):
+            groups.setdefault(group, []).append(issue)
+    return groups
+
+def evaluate_groups(metric_data_loaded, project, get_issues=None, changelogs=None):
+    """Runs a single metric config for a single project, once per group_by group.
+
+    Issues are fetched once per data provider and partitioned, instead of
+    querying JIRA once per group.
+
+    Args:
+        metric_data_loaded:	Dictionary	The metric configuration JSON block.
+        project:		String		JIRA project key.
+        get_issues:		Function	Returns the issues for a data provider,
+                       				defaults to JP.get_issues.
+        changelogs:		Dictionary	Issue changelogs by issue key. Changelogs
+                       				fetched from JIRA are added to it and shared
+                       				between groups, so an issue in several groups
+                       				is fetched once.
+
+    Returns:
+        List of (tags, points) pairs, a single one with no tags if the metric
+        has no group_by.
+    """
+    if not metric_data_loaded.get('group_by'):
+        return [([], evaluate_metric(metric_data_loaded, project, get_issues, changelogs))]
+    if get_issues is None:
+        get_issues = JP.get_issues
+    if changelogs is None:
+        changelogs = {}
+    groups = {}
+    for position in ['issues', 'numerator', 'denominator']:
+        if metric_data_loaded.get(position, {}).get('source') == 'jira':
+            groups[position] = group_issues(get_issues(metric_data_loaded, position, project),
+                                            metric_data_loaded['group_by'])
+    results = []
+    for group in sorted(set(group for issues in groups.values() for group in issues)):
+        points = evaluate_metric(metric_data_loaded,
+                                 project,
+                                 lambda metric, position, project, group=group:
+                                 groups[position].get(group, []),
+                                 changelogs)
+        results.append((list(group), points))
+    return results
+
+# Metric config and project pairs for this shard, set before forking the
+# worker pool so the workers inherit them instead of having them pickled.
+RUN_UNITS = []
+
+def unit_hash(metric_name, project):
+    """Stable hash of a metric/project pair, the same on every host and run.
+
+    Args:
+        metric_name:	String		Name of the metric.
+        project:	String		JIRA project key.
+
+    Returns:
+        Long integer.
+    """
+    return int(hashlib.md5((metric_name + '/' + project).encode('utf-8')).hexdigest(), 16)
+
+def parse_shard(shard):
+    """Converts a shard like 0/4 to its index and the number of shards.
+
+    Args:
+        shard:	String		I/N, where 0 <= I < N.
+
+    Returns:
+        Tuple of integers, the shard index and the number of shards.
+    """
+    try:
+        index, shards = [int(number) for number in shard.split('/')]
+    except ValueError:
+        raise ValueError("shard must be I/N: " + shard)
+    if shards < 1 or not 0 <= index < shards:
+        raise ValueError("shard index must be from 0 to N-1: " + shard)
+    return index, shards
+
+def shard_units(metric_file_full, shard, shards):
+    """Lists the metric/project pairs that belong to a shard.
+
+    Args:
+        metric_file_full:	List		Metric configuration JSON blocks.
+        shard:			Integer		Index of this shard.
+        shards:			Integer		Number of shards.
+
+    Returns:
+        List of metric config and project pairs, in metric file order.
+    """
+    return [(metric_data_loaded, project)
+            for metric_data_loaded in metric_file_full
+            for project in metric_data_loaded['projects']
+            if unit_hash(metric_data_loaded['metric_name'], project) % shards == shard]
+
+def run_unit(metric_data_loaded, project):
+    """Runs a single metric config for a single project.
+
+    Args:
+        metric_data_loaded:	Dictionary	The metric configuration JSON block.
+        project:		String		JIRA project key.
+
+    Returns:
+        List of metric dictionaries, same format as the main payload, one per
+        group_by group.
+    """
+    logging.info('project: %s', project)
+    unit = metric_data_loaded['metric_name'] + '/' + project
+    journaled = JOURNAL.lookup('unit', unit)
+    if journaled:
+        logging.info('%s already ran, resuming from the journal', unit)
+        INSTRUMENTATION.increment('journal.resumed')
+        for metric_data in journaled[-1]:
+            metric_data['points'] = tuple(metric_data['points'])
+        return journaled[-1]
+    with INSTRUMENTATION.unit(metric_data_loaded['metric_name'], project):
+        groups = evaluate_groups(metric_data_loaded, project)
+
+    ## Construct payload for upload
+    payload = [{
+        'metric': metric_data_loaded['metric_name'],
+        'points': (NOW, points),
+        'tags': ["jira_project:%s" % project] + tags
+        } for tags, points in groups]
+    JOURNAL.record('unit', unit, payload)
+    return payload
+
+def run_worker(task):
+    """Runs the units in RUN_UNITS assigned to one local worker.
+
+    Runs in a pool worker. Units are assigned on the part of their hash not
+    already used to pick the shard, so workers split a shard evenly.
+
+    Args:
+        task:	Tuple		Worker index, number of workers and number of shards.
+
+    Returns:
+        Tuple of the (unit index, metric dictionaries) pairs that were run, and
+        the worker's instrumentation timings and counters.
+    """
+    worker, workers, shards = task
+    INSTRUMENTATION.reset()
+    JOURNAL.fork(worker)
+    payload = []
+    for index, (metric_data_loaded, project) in enumerate(RUN_UNITS):
+        if unit_hash(metric_data_loaded['metric_name'], project) // shards % workers == worker:
+            payload.append((index, run_unit(metric_data_loaded, project)))
+    return payload, INSTRUMENTATION.timings, INSTRUMENTATION.counters
+
+def run_units(units, shards=1, workers=1):
+    """Runs metric/project pairs, fanning out to local processes if asked.
+
+    Args:
+        units:		List		Metric config and project pairs to run.
+        shards:		Integer		Number of shards, across hosts.
+        workers:	Integer		Number of local processes.
+
+    Returns:
+        List of metric dictionaries, in the same order as units.
+    """
+    if workers == 1:
+        return [metric_data for metric_data_loaded, project in units
+                for metric_data in run_unit(metric_data_loaded, project)]
+    RUN_UNITS[:] = units
+    # Each worker gets an equal share of the rate, so together they stay within it.
+    RATE_LIMITER.configure(RATE_LIMITER.max_rate / workers,
+                           max(RATE_LIMITER.burst / workers, 1),
+                           RATE_LIMITER.max_retries)
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = pool.map(run_worker, [(worker, workers, shards) for worker in range(workers)])
+    finally:
+        pool.close()
+        pool.join()
+    payload = []
+    for worker_payload, timings, counters in results:
+        payload.extend(worker_payload)
+        INSTRUMENTATION.merge(timings, counters)
+    return [metric_data for index, unit_payload in sorted(payload)
+            for metric_data in unit_payload]
+
+# Changelog field names that differ from the issue field they change, for
+# JIRA versions that don't return the fieldId in changelog items.
+CHANGELOG_FIELDS = {
+    'Fix Version': 'fixVersions',
+    'Version': 'versions',
+    'Component': 'components'
+}
+USER_FIELDS = ['assignee', 'reporter', 'creator']
+STEP_UNITS = {
+    's': 1,
+    'm': 60,
+    'h': 3600,
+    'd': 86400,
+    'w': 604800
+}
+# Fetched issues and changelogs per metric/project, set before forking the
+# backfill pool so the workers inherit them instead of having them pickled.
+BACKFILL_UNITS = []
+
+def parse_step(step):
+    """Converts a step like 1d or 6h to seconds.
+
+    Args:
+        step:	String		Number followed by one of s, m, h, d, w.
+
+    Returns:
+        Integer of seconds.
+    """
+    if len(step) < 2 or step[-1] not in STEP_UNITS or not step[:-1].isdigit() \
+       or int(step[:-1]) == 0:
+        raise ValueError("step must be a positive number followed by one of " + \
+                         ', '.join(sorted(STEP_UNITS)) + ": " + step)
+    return int(step[:-1]) * STEP_UNITS[step[-1]]
+
+def changelog_as_of(changelog, timestamp):
+    """Drops the changelog histories that happened after timestamp.
+
+    Args:
+        changelog:	List		Issue changelog from the REST API.
+        timestamp:	Float		Unix timestamp.
+
+    Returns:
+        List of changelog histories.
+    """
+    return [history for history in changelog
+            if time.mktime(pretty_date(history['created'])) <= timestamp]
+
+def revert_field(fields, item):
+    """Sets a field back to its value before a changelog item.
+
+    Args:
+        fields:	Dictionary	Raw issue fields, modified in place.
+        item:	Dictionary	A single item from a changelog history.
+    """
+    field = item.get('fieldId', CHANGELOG_FIELDS.get(item['field'], item['field']))
+    if field not in fields:
+        return
+    value = fields[field]
+    if field == 'labels':
+        fields[field] = (item.get('fromString') or '').split()
+    elif isinstance(value, list):
+        if item.get('to') is not None:
+            fields[field] = [entry for entry in value
+                             if str(entry.get('id')) != str(item['to'])]
+        if item.get('from') is not None:
+            fields[field].append({'id': item['from'], 'name': item.get('fromString')})
+    elif item.get('from') is None and item.get('fromString') is None:
+        fields[field] = None
+        if field == 'resolution':
+            fields['resolutiondate'] = None
+    elif field in USER_FIELDS:
+        fields[field] = {'name': item['from'],
+                         'key': item['from'],
+                         'displayName': item.get('fromString')}
+    elif isinstance(value, dict) or (value is None and item.get('from') is not None):
+        fields[field] = {'id': item.get('from'), 'name': item.get('fromString')}
+    elif isinstance(value, (int, float)) or value is None:
+        try:
+            fields[field] = float(item['fromString'])
+        except (TypeError, ValueError):
+            fields[field] = item['fromString']
+    else:
+        fields[field] = item.get('fromString')
+
+def issue_as_of(raw, changelog, timestamp):
+    """Reconstructs an issue as it was at a point in time from its changelog.
+
+    Args:
+        raw:		Dictionary	Issue JSON, as returned by the REST API.
+        changelog:	List		The issue's changelog from the REST API.
+        timestamp:	Float		Unix timestamp.
+
+    Returns:
+        Dictionary of the issue JSON at timestamp, None if it didn't exist yet.
+    """
+    if time.mktime(pretty_date(raw['fields']['created'])) > timestamp:
+        return None
+    issue = dict(raw)
+    issue['fields'] = copy.deepcopy(raw['fields'])
+    histories = sorted(changelog,
+                       key=lambda history: time.mktime(pretty_date(history['created'])),
+                       reverse=True)
+    for history in histories:
+        if time.mktime(pretty_date(history['created'])) <= timestamp:
+            break
+        for item in history['items']:
+            revert_field(issue['fields'], item)
+    return issue
+
+def backfill_view(metric_data_loaded):
+    """Swaps each data provider's jql and filter for its backfill block, if any.
+
+    Args:
+        metric_data_loaded:	Dictionary	The metric configuration JSON block.
+
+    Returns:
+        Dictionary of the metric config to run the backfill with.
+    """
+    metric_view = copy.deepcopy(metric_data_loaded)
+    for position in ['issues', 'numerator', 'denominator']:
+        if metric_view.get(position, {}).get('source') == 'jira':
+            metric_view[position].update(metric_view[position].pop('backfill', {}))
+    return metric_view
+
+def has_status_dates(metric_data_loaded, position, issue):
+    """Checks that the issue fields mean_time_between_statuses reads are set.
+
+    A reconstructed issue may not have reached a status yet at a backfill
+    step, e.g. its resolutiondate is unset before it was resolved.
+
+    Args:
+        metric_data_loaded:	Dictionary	The metric configuration JSON block.
+        position:		String		Either 'numerator' or 'denominator'.
+        issue:			Object		Issue from the JIRA SDK.
+
+    Returns:
+        Boolean, False if a status date taken from the issue renders empty.
+    """
+    for status in metric_data_loaded[position]['statuses'][:2]:
+        if status['source'] == 'issue' and \
+           render_template(status['date'], issue=issue).strip() in ['', 'None']:
+            return False
+    return True
+
+def backfill_point(task):
+    """Evaluates one metric/project at one historical timestamp.
+
+    Runs in a pool worker, using the issues in BACKFILL_UNITS.
+
+    Args:
+        task:	Tuple		Index into BACKFILL_UNITS and a unix timestamp.
+
+    Returns:
+        List of metric dictionaries, same format as the main payload.
+    """
+    unit, timestamp = task
+    metric_data_loaded, project, raw_issues, changelogs = BACKFILL_UNITS[unit]
+    issues = {}
+    for position, raws in raw_issues.iteritems():
+        issues[position] = []
+        for raw in raws:
+            raw = issue_as_of(raw, changelogs[raw['key']], timestamp)
+            if raw is not None:
+                issues[position].append(JiraProvider.issue_from_raw(raw))
+        if metric_data_loaded[position].get('filter', False) is not False:
+            issues[position] = JiraProvider.filter_issues(metric_data_loaded,
+                                                          issues[position],
+                                                          position)
+        if metric_data_loaded[position].get('method') == 'mean_time_between_statuses':
+            dated_issues = [issue for issue in issues[position]
+                            if has_status_dates(metric_data_loaded, position, issue)]
+            if len(dated_issues) < len(issues[position]):
+                logging.info('%s %s: leaving out %s issues without their status dates at %s',
+                             metric_data_loaded['metric_name'],
+                             position,
+                             len(issues[position]) - len(dated_issues),
+                             timestamp)
+            issues[position] = dated_issues
+    changelogs = dict((key, changelog_as_of(changelog, timestamp))
+                      for key, changelog in changelogs.iteritems())
+    groups = evaluate_groups(metric_data_loaded,
+                             project,
+                             lambda metric, position, project: issues[position],
+                             changelogs)
+    return [{
+        'metric': metric_data_loaded['metric_name'],
+        'points': (timestamp, points),
+        'tags': ["jira_project:%s" % project] + tags
+        } for tags, points in groups]
+
+def backfill(units, start, end, step, workers=None):
+    """Evaluates metrics at every step between two timestamps.
+
+    Issues and their changelogs are fetched once per metric/project, and
+    reconstructed as they were at each step instead of querying JIRA per step.
+
+    Args:
+        units:		List		Metric config and project pairs to run.
+        start:		Float		Unix timestamp of the first step.
+        end:		Float		Unix timestamp of the last step.
+        step:		Integer		Seconds between steps.
+        workers:	Integer		Processes to evaluate steps with, one per CPU if None.
+
+    Returns:
+        List of metric dictionaries, same format as the main payload.
+    """
+    del BACKFILL_UNITS[:]
+    for metric_data_loaded, project in units:
+        if metric_data_loaded.get('grouping', False) is not False:
+            logging.warning('%s is grouped by sprint and can not be backfilled, skipping',
+                            metric_data_loaded['metric_name'])
+            continue
+        metric_view = backfill_view(metric_data_loaded)
+        raw_issues = {}
+        changelogs = {}
+        with INSTRUMENTATION.unit(metric_view['metric_name'], project):
+            for position in ['issues', 'numerator', 'denominator']:
+                if metric_view.get(position, {}).get('source') != 'jira':
+                    continue
+                query = JP.render_jql(metric_view, position, project)
+                issues = JP.search_issues(query, hashlib.sha512(query).hexdigest())
+                raw_issues[position] = [issue.raw for issue in issues]
+                for issue in issues:
+                    if issue.key not in changelogs:
+                        changelogs[issue.key] = JP.get_issue_changelog(API_URL,
+                                                                       API_USERNAME,
+                                                                       API_PASSWORD,
+                                                                       issue.key)
+        BACKFILL_UNITS.append((metric_view, project, raw_issues, changelogs))
+
+    timestamps = []
+    timestamp = start
+    while timestamp <= end:
+        timestamps.append(timestamp)
+        timestamp = timestamp + step
+    tasks = [(unit, timestamp) for unit in range(len(BACKFILL_UNITS))
+             for timestamp in timestamps]
+    logging.info('backfilling %s points', len(tasks))
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = pool.map(backfill_point, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    return [metric_data for points in results for metric_data in points]
+
 def main():
     """Main function, calls all other functions.
 
     Returns:
         In a standard run, no output.
     """
+    # A resumed run submits its points at the time the run started.
+    global NOW #pylint: disable=W0603
     parser = argparse.ArgumentParser()
     parser.add_argument('-m', '--metric',
                         metavar='METRIC',
@@ -372,6 +1724,37 @@ def main():
     parser.add_argument('-d', '--describe',
                         help='Prints the configuration block for the specified metric',
                         action='store_true')
+    parser.add_argument('-p', '--profile',
+                        help='Prints a per-metric timing breakdown after the run',
+                        action='store_true')
+    snapshot = parser.add_mutually_exclusive_group()
+    snapshot.add_argument('--snapshot-write',
+                          help='Dumps everything fetched from JIRA to a local snapshot file',
+                          metavar='FILE')
+    snapshot.add_argument('--snapshot-read',
+                          help='Evaluates metrics from a snapshot file, without calling JIRA',
+                          metavar='FILE')
+    parser.add_argument('-b', '--backfill',
+                        help='Evaluates the metrics at every step between two dates (YYYY-mm-dd)',
+                        nargs=2,
+                        metavar=('FROM', 'TO'))
+    parser.add_argument('-s', '--step',
+                        help='Time between backfill steps, e.g. 6h, 1d, 1w. Default: 1d',
+                        default='1d')
+    parser.add_argument('-S', '--shard',
+                        help='Runs only the metric/project pairs of shard I of N, e.g. 0/4',
+                        metavar='I/N')
+    parser.add_argument('-w', '--workers',
+                        help='Number of local processes to run metrics with. Default: 1, ' + \
+                             'or one per CPU with --backfill',
+                        type=int)
+    parser.add_argument('-r', '--resume',
+                        help='Resumes the last run from its journal, skipping what it finished',
+                        action='store_true')
+    parser.add_argument('--journal',
+                        help='Private directory to checkpoint the run to. Default: ' + \
+                             'local.journal_dir from the config',
+                        metavar='DIR')
     parser.add_argument('-V', '--verbosity',
                         help='Sets verbosity level: notset, debug, info, warning, error, critical.')
     parser.add_argument('-v', '--version',
@@ -382,12 +1765,24 @@ def main():
 
     logging.info('api configuration set')
 
+    # Every JIRA call goes through the rate limiter.
+    rate_limit = CONFIG_DATA_LOADED['jira'].get('rate_limit', {})
+    if not rate_limit.get('rate', 10) > 0:
+        logging.critical('jira.rate_limit.rate must be more than 0.')
+        sys.exit(2)
+    if rate_limit.get('burst') is not None and not rate_limit['burst'] >= 1:
+        logging.critical('jira.rate_limit.burst must be 1 or more.')
+        sys.exit(2)
+    RATE_LIMITER.configure(rate_limit.get('rate', 10),
+                           rate_limit.get('burst'),
+                           rate_limit.get('max_retries', 5))
+
     # Setting up DataDog SDK
     initialize(**CONFIG_DATA_LOADED['datadog'])
     logging.info('initializated datadog SDK')
 
     # Loads the metric configuration file
-    metric_file_full = load_metric_file(METRIC_JSON, args.metric)
+    metric_file_full = load_metric_file(METRIC_JSON, args.metric, METRIC_SCHEMA, METRIC_CACHE)
 
     if args.list:
         for metric in metric_file_full:
@@ -397,8 +1792,7 @@ def main():
     if args.describe:
         if args.metric:
             for metric in metric_file_full:
-                if args.metric in metric['metric_name']:
-                    pprint(metric)
+                pprint(metric)
         else:
             pprint(metric_file_full)
         sys.exit(0)
@@ -423,61 +1817,60 @@ def main():
 
     logging.info('loaded metric config')
 
-    # Loops through list of metrics defined in a single file
-    project = None
-    for metric_data_loaded in metric_file_full:
-        # Loop over specified projects in the metric config file.
-        for project in metric_data_loaded['projects']:
-            logging.info('project: %s', project)
-            numbers = []
-            total_time_between_statuses = 0
-            if metric_data_loaded['method'] == 'average':
-                ## Find the average from data providers.
-                logging.info('method: %s', metric_data_loaded['method'])
-
-                for position in ['numerator', 'denominator']:
-                    if metric_data_loaded[position]['source'] == 'jira':
-
-                        ## Get's list of issues from JIRA SDK
-                        issues = JP.get_issues(metric_data_loaded, position, project)
-
-                        if metric_data_loaded[position]['method'] == 'ticket_count':
-                            numbers.append(len(issues))
-                        elif metric_data_loaded[position]['method'] == 'custom_field_sum':
-                            numbers.append(custom_field_sum(issues,
-                                                            metric_data_loaded[position]['field']))
-                        elif metric_data_loaded[position]['method'] == 'mean_time_between_statuses':
-                            for issue in issues:
-                                m_t = mean_time_between_statuses(metric_data_loaded,
-                                                                 position,
-                                                                 issue)
-                                total_time_between_statuses = total_time_between_statuses + m_t
-                            numbers.append(total_time_between_statuses)
-                    elif metric_data_loaded[position]['source'] == 'constant':
-                        numbers.append(metric_data_loaded[position]['data'][project])
-
-                    if len(numbers) == 2:
-                        if float(numbers[1]) != 0:
-                            points = float(numbers[0]) / float(numbers[1])
-                        else:
-                            points = 0
-
-            elif metric_data_loaded['method'] == 'direct':
-                issues = JP.get_issues(metric_data_loaded, 'issues', project)
-                if metric_data_loaded['issues']['method'] == 'ticket_count':
-                    points = len(issues)
-
-        ## Construct payload for upload
-            metric_data = {
-                'metric': metric_data_loaded['metric_name'],
-                'points': (NOW, points),
-                'tags': ["jira_project:%s" % project]
-                }
-            PAYLOAD.append(metric_data)
+    # A snapshot's data is old, uploading it timestamped now would corrupt the live series.
+    if args.snapshot_read and not args.noop:
+        logging.critical('--snapshot-read can only be used with --noop.')
+        sys.exit(2)
+    if args.snapshot_write:
+        SNAPSHOT.open_write(args.snapshot_write)
+    elif args.snapshot_read:
+        SNAPSHOT.open_read(args.snapshot_read)
+
+    try:
+        shard, shards = parse_shard(args.shard) if args.shard else (0, 1)
+    except ValueError as error:
+        logging.critical('shard argument is not valid: %s', error)
+        sys.exit(2)
+    if args.workers is not None and args.workers < 1:
+        logging.critical('workers argument must be 1 or more.')
+        sys.exit(2)
+    if args.snapshot_write and not args.backfill and args.workers > 1:
+        logging.critical('--snapshot-write can only be used with a single worker.')
+        sys.exit(2)
+    if args.backfill:
+        try:
+            start, end = [time.mktime(time.strptime(date, '%Y-%m-%d')) for date in args.backfill]
+            step = parse_step(args.step)
+        except ValueError as error:
+            logging.critical('backfill arguments are not valid: %s', error)
+            sys.exit(2)
+
+    # Nothing is fetched from JIRA when reading a snapshot, so there is nothing to checkpoint.
+    if not args.snapshot_read:
+        signature = hashlib.md5(json.dumps([file_signature(METRIC_JSON),
+                                            args.metric,
+                                            [shard, shards],
+                                            args.backfill,
+                                            args.step])).hexdigest()
+        NOW = JOURNAL.open(args.journal or JOURNAL_DIR, signature, NOW, args.resume)
+        if not args.backfill and time.time() - NOW > 3600:
+            logging.warning('resuming a run from over an hour ago, DataDog may drop its points')
+
+    units = shard_units(metric_file_full, shard, shards)
+    logging.info('running %s metric/project pairs in shard %s/%s', len(units), shard, shards)
+
+    if args.backfill:
+        PAYLOAD.extend(backfill(units, start, end, step, args.workers))
+    else:
+        PAYLOAD.extend(run_units(units, shards, args.workers or 1))
 
+    SNAPSHOT.close()
     logging.info('payload: %s', PAYLOAD)
+    # Kept out of the --noop report, --profile prints them per metric instead.
+    internal_payload = INSTRUMENTATION.payload(NOW)
 
     if args.noop:
+        # Points of group_by metrics have their group tags after the project.
         if not args.formatting or args.formatting == 'json':
             pprint(PAYLOAD)
         elif args.formatting == 'jira':
@@ -487,6 +1880,7 @@ def main():
                       line['metric'] + \
                       '|' + \
                       line['tags'][0] + \
+                      ''.join(' ' + tag for tag in line['tags'][1:]) + \
                       '|' + \
                       str(line['points'][1]) + \
                       '|'
@@ -498,6 +1892,7 @@ def main():
                       line['metric'] + \
                       '|' + \
                       line['tags'][0] + \
+                      ''.join(' ' + tag for tag in line['tags'][1:]) + \
                       '|' + \
                       str(line['points'][1]) + \
                       '|'
@@ -507,12 +1902,28 @@ def main():
                 print payload['metric'] + \
                       ',' + \
                       payload['tags'][0] + \
+                      ''.join(' ' + tag for tag in payload['tags'][1:]) + \
                       ',' + \
                       str(payload['points'][1])
     else:
         # Upload to DataDog
-        api.Metric.send(PAYLOAD)
-        logging.info('uploaded to DataDog')
+        upload_start = time.time()
+        api.Metric.send(PAYLOAD + internal_payload)
+        upload_duration = time.time() - upload_start
+        logging.info('uploaded to DataDog in %.2fs', upload_duration)
+        # Upload latency can only be known after the upload, so it goes separately.
+        api.Metric.send([{
+            'metric': 'jiradog.internal.datadog.upload.duration',
+            'points': (NOW, upload_duration),
+            'tags': []
+            }])
+
+    # The run succeeded, so the next one starts over.
+    JOURNAL.remove()
+
+    if args.profile:
+        for line in INSTRUMENTATION.profile():
+            print line
 
 if __name__ == "__main__":
     # Setting important variables, all static.
@@ -550,6 +1961,19 @@ if __name__ == "__main__":
     API_ENDPOINT = API_URL + '/rest/api/2/search?jql='
     LOG_FILE = CONFIG_DATA_LOADED['local']['log_file']
     METRIC_JSON = CONFIG_DATA_LOADED['local']['metric_file']
+    METRIC_SCHEMA = CONFIG_DATA_LOADED['local'].get('schema_file',
+                                                    '/etc/jiradog/metrics.schema.json')
+    # Run state (metric cache, journals) belongs to the user running jiradog,
+    # not next to the config in /etc/jiradog.
+    if os.getuid() == 0:
+        STATE_DIR = CONFIG_DATA_LOADED['local'].get('state_dir', '/var/lib/jiradog')
+    else:
+        STATE_DIR = CONFIG_DATA_LOADED['local'].get('state_dir',
+                                                    os.path.expanduser('~/.cache/jiradog'))
+    METRIC_CACHE = CONFIG_DATA_LOADED['local'].get('metric_cache_file',
+                                                   os.path.join(STATE_DIR, 'metrics.cache.json'))
+    JOURNAL_DIR = CONFIG_DATA_LOADED['local'].get('journal_dir',
+                                                  os.path.join(STATE_DIR, 'journal'))
 
     # Set logging config
     LOGGING_LEVELS = {
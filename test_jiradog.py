@@ -6,11 +6,33 @@ import json
 import time
 import datetime
 import random
+import os
+import tempfile
+import requests
+import jiradog
 from jiradog import mean_time_between_statuses
 from jiradog import load_metric_file
 from jiradog import pretty_date
 from jiradog import custom_field_sum
 from jiradog import JiraProvider
+from jiradog import Instrumentation
+from jiradog import Snapshot
+from jiradog import issue_as_of
+from jiradog import backfill_point
+from jiradog import BACKFILL_UNITS
+from jiradog import parse_step
+from jiradog import parse_shard
+from jiradog import shard_units
+from jiradog import validate_metric_file
+from jiradog import schema_error
+from jiradog import RateLimiter
+from jiradog import retry_after_seconds
+from jiradog import evaluate_groups
+from jiradog import group_values
+from jiradog import Journal
+from jiradog import JOURNAL
+import jsonschema
+from jira.client import ResultList
 
 class JiradogTestCase(unittest.TestCase):
     """Testing for `jiradog.py`"""
@@ -242,6 +264,60 @@ class JiradogTestCase(unittest.TestCase):
                             config_data_loaded['jira']['password'])
         self.assertIs(type(jira.get_issues(metric_data_loaded, position, project)), list)
 
+    def test_jira_search_issues_pagination(self):
+        """Test if every issue is returned when the server caps the page size.
+
+        Returns:
+            expected True
+        """
+        class PretendJiraServer(object): #pylint: disable=R0903
+            """Fake JIRA SDK client, used to imitate a server capping maxResults."""
+            def __init__(self, issues, page_cap):
+                """Define fake attributes"""
+                self.issues = issues
+                self.page_cap = page_cap
+                self.requests = []
+
+            def search_issues(self, query, maxResults, startAt): #pylint: disable=C0103,W0613
+                """Returns a page of issues, no larger than page_cap."""
+                self.requests.append(maxResults)
+                max_results = min(maxResults, self.page_cap)
+                return ResultList(self.issues[startAt:startAt + max_results],
+                                  startAt,
+                                  max_results,
+                                  len(self.issues))
+
+        page_cap = random.randint(1, 200)
+        issues = range(random.randint(1, 1000))
+        jira = JiraProvider('https://example.jira.com', 'username', 'password')
+        jira._jira = PretendJiraServer(issues, page_cap) #pylint: disable=W0212
+
+        self.assertEqual(jira.search_issues('project=OPS', 'cafe'), issues)
+        self.assertIn(jira.page_cap, [None, page_cap])
+        self.assertLessEqual(len(jira._jira.requests), #pylint: disable=W0212
+                             len(issues) // min(page_cap, 100) + 2)
+
+    def test_rate_limiter(self):
+        """Test if the rate limiter halves on throttling and climbs back on success.
+
+        Returns:
+            expected True
+        """
+        rate = random.randint(10, 100)
+        rate_limiter = RateLimiter(rate=rate, burst=2)
+        rate_limiter.acquire()
+        rate_limiter.acquire()
+        rate_limiter.throttled(0)
+        self.assertEqual(rate_limiter.rate, rate / 2.0)
+        for _ in range(100):
+            rate_limiter.succeeded()
+        self.assertEqual(rate_limiter.rate, rate)
+
+        self.assertEqual(retry_after_seconds(str(rate)), rate)
+        self.assertEqual(retry_after_seconds('Thu, 01 Jan 1970 00:00:00 GMT'), 0)
+        self.assertIsNone(retry_after_seconds('soon'))
+        self.assertIsNone(retry_after_seconds(None))
+
     def test_jira_get_sprints(self):
         """Test if given board returns sprints
 
@@ -268,6 +344,35 @@ class JiradogTestCase(unittest.TestCase):
                                                    project)),
                        count)
 
+    def test_jira_get_sprints_error(self):
+        """Test if an error from a sprint board raises instead of returning nothing.
+
+        Returns:
+            expected True
+        """
+        class PretendResponse(object): #pylint: disable=R0903
+            """Fake requests response, used to imitate a JIRA error."""
+            def __init__(self, status_code):
+                """Define fake attributes"""
+                self.status_code = status_code
+                self.text = '{"errorMessages":["Board does not exist"]}'
+
+            def raise_for_status(self):
+                """Raises like requests does, for 4xx and 5xx only."""
+                if self.status_code >= 400:
+                    raise requests.HTTPError(str(self.status_code), response=self)
+
+        metric_data_loaded = {'grouping': {'count': '-1', 'boards': {'SYS': '478'}}}
+        jira_get = jiradog.jira_get
+        try:
+            for status_code in [random.choice([400, 404, 500]), 204]:
+                jiradog.jira_get = lambda url, auth, status_code=status_code: \
+                                   PretendResponse(status_code)
+                self.assertRaises(requests.HTTPError, JiraProvider.get_sprints,
+                                  metric_data_loaded, 'username', 'password', 'SYS')
+        finally:
+            jiradog.jira_get = jira_get
+
     def test_get_issue_changelog(self):
         """Test if given issue's changelog is successfully retrieved.
 
@@ -281,5 +386,483 @@ class JiradogTestCase(unittest.TestCase):
                             config_data_loaded['jira']['username'],
                             config_data_loaded['jira']['password'])
 
+    def test_instrumentation_payload(self):
+        """Test if recorded timings and counters are exported with their unit tags.
+
+        Returns:
+            expected True
+        """
+        pages = random.randint(1, 10)
+        instrumentation = Instrumentation()
+        with instrumentation.unit('jiradog.bugsOpen.count', 'OPS'):
+            instrumentation.increment('jira.pages', pages)
+            instrumentation.add_timing('query.jql.duration', pages, ('jql:cafe',))
+        instrumentation.increment('cache.hits')
+        payload = instrumentation.payload(0)
+        metrics = [(line['metric'], line['tags'], line['points'][1]) for line in payload]
+        unit_tags = ['metric:jiradog.bugsOpen.count', 'jira_project:OPS']
+
+        self.assertIn(('jiradog.internal.jira.pages', unit_tags, pages), metrics)
+        self.assertIn(('jiradog.internal.query.jql.duration', unit_tags + ['jql:cafe'], pages),
+                      metrics)
+        self.assertIn(('jiradog.internal.cache.hits', [], 1), metrics)
+        self.assertIn('jiradog.internal.metric.duration', [line[0] for line in metrics])
+        self.assertEqual(len(instrumentation.profile()), 2)
+
+    def test_snapshot(self):
+        """Test if records written to a snapshot are read back.
+
+        Returns:
+            expected True
+        """
+        changelog = [{'created': '2018-01-11T10:20:30.000+0000', 'items': []}]
+        issues = [{'key': 'OPS-%s' % number, 'fields': {}} for number in range(random.randint(1, 10))]
+        snapshot_path = tempfile.mkstemp()[1]
+
+        os.chmod(snapshot_path, 0o644)
+
+        snapshot = Snapshot()
+        snapshot.open_write(snapshot_path)
+        self.assertEqual(os.stat(snapshot_path).st_mode & 0o777, 0o600)
+        snapshot.record('search', 'cafe', issues)
+        snapshot.record('changelog', 'OPS-1', changelog)
+        snapshot.close()
+
+        snapshot = Snapshot()
+        snapshot.open_read(snapshot_path)
+        self.assertEqual(snapshot.lookup('changelog', 'OPS-1'), changelog)
+        self.assertEqual(snapshot.lookup('search', 'cafe'), issues)
+        snapshot.close()
+        os.remove(snapshot_path)
+
+    def test_issue_as_of(self):
+        """Test if an issue is reconstructed from its changelog at a point in time.
+
+        Returns:
+            expected True
+        """
+        raw = {
+            'key': 'OPS-1',
+            'fields': {
+                'created': '2018-01-01T00:00:00.000+0000',
+                'status': {'id': '3', 'name': 'Done'},
+                'customfield_0': 8
+            }
+        }
+        changelog = [
+            {
+                'created': '2018-01-03T00:00:00.000+0000',
+                'items': [
+                    {'field': 'status', 'from': '1', 'fromString': 'Open',
+                     'to': '3', 'toString': 'Done'},
+                    {'field': 'Story Points', 'fieldId': 'customfield_0', 'from': None,
+                     'fromString': '5', 'to': None, 'toString': '8'}
+                ]
+            }
+        ]
+        before = time.mktime(time.strptime('2018-01-02', '%Y-%m-%d'))
+        after = time.mktime(time.strptime('2018-01-04', '%Y-%m-%d'))
+        created = time.mktime(time.strptime('2017-12-31', '%Y-%m-%d'))
+
+        self.assertEqual(issue_as_of(raw, changelog, before)['fields']['status']['name'], 'Open')
+        self.assertEqual(issue_as_of(raw, changelog, before)['fields']['customfield_0'], 5)
+        self.assertEqual(issue_as_of(raw, changelog, after), raw)
+        self.assertIsNone(issue_as_of(raw, changelog, created))
+        self.assertEqual(raw['fields']['status']['name'], 'Done')
+
+    def test_backfill_point(self):
+        """Test if a backfilled point counts issues by their status at the step.
+
+        Returns:
+            expected True
+        """
+        open_count = random.randint(1, 10)
+        raw_issues = [{'key': 'OPS-%s' % number,
+                       'fields': {'created': '2018-01-01T00:00:00.000+0000',
+                                  'status': {'id': '3', 'name': 'Done'}}}
+                      for number in range(open_count + random.randint(0, 10))]
+        changelogs = {}
+        for number, raw in enumerate(raw_issues):
+            changelogs[raw['key']] = []
+            if number < open_count:
+                changelogs[raw['key']].append({
+                    'created': '2018-01-03T00:00:00.000+0000',
+                    'items': [{'field': 'status', 'from': '1', 'fromString': 'Open',
+                               'to': '3', 'toString': 'Done'}]
+                })
+        metric = {
+            'metric_name': 'jiradog.bugsOpen.count',
+            'method': 'direct',
+            'issues': {
+                'source': 'jira',
+                'method': 'ticket_count',
+                'filter': "{% if issue.fields.status.name == 'Open' %}true{% endif %}"
+            }
+        }
+        before = time.mktime(time.strptime('2018-01-02', '%Y-%m-%d'))
+        after = time.mktime(time.strptime('2018-01-04', '%Y-%m-%d'))
+        BACKFILL_UNITS[:] = [(metric, 'OPS', {'issues': raw_issues}, changelogs)]
+
+        self.assertEqual(backfill_point((0, before))[0]['points'], (before, open_count))
+        self.assertEqual(backfill_point((0, after))[0]['points'], (after, 0))
+        del BACKFILL_UNITS[:]
+
+    def test_backfill_point_mean_time(self):
+        """Test if issues not yet resolved at a step are left out of a mean time to resolve.
+
+        Returns:
+            expected True
+        """
+        days = random.randint(1, 9)
+        raw = {'key': 'OPS-1',
+               'fields': {'created': '2018-01-01T00:00:00.000+0000',
+                          'resolution': {'id': '1', 'name': 'Done'},
+                          'resolutiondate': '2018-01-1%sT00:00:00.000+0000' % days}}
+        changelogs = {'OPS-1': [{
+            'created': '2018-01-1%sT00:00:00.000+0000' % days,
+            'items': [{'field': 'resolution', 'from': None, 'fromString': None,
+                       'to': '1', 'toString': 'Done'}]
+        }]}
+        metric = {
+            'metric_name': 'jiradog.bugsResolved.meanTimeToResolve',
+            'method': 'average',
+            'numerator': {
+                'source': 'jira',
+                'method': 'mean_time_between_statuses',
+                'statuses': [{'source': 'issue', 'date': '{{issue.fields.created}}'},
+                             {'source': 'issue', 'date': '{{issue.fields.resolutiondate}}'}]
+            },
+            'denominator': {'source': 'constant', 'data': {'OPS': 1}}
+        }
+        before = time.mktime(time.strptime('2018-01-05', '%Y-%m-%d'))
+        after = time.mktime(time.strptime('2018-01-20', '%Y-%m-%d'))
+        BACKFILL_UNITS[:] = [(metric, 'OPS', {'numerator': [raw]}, changelogs)]
+
+        self.assertEqual(backfill_point((0, before))[0]['points'], (before, 0))
+        self.assertEqual(backfill_point((0, after))[0]['points'], (after, 10 + days - 1))
+        del BACKFILL_UNITS[:]
+
+    def test_parse_step(self):
+        """Test if backfill steps convert to seconds.
+
+        Returns:
+            expected True
+        """
+        count = random.randint(1, 10)
+        self.assertEqual(parse_step(str(count) + 'd'), count * 86400)
+        self.assertEqual(parse_step(str(count) + 'h'), count * 3600)
+        self.assertRaises(ValueError, parse_step, 'd')
+        self.assertRaises(ValueError, parse_step, str(count) + 'y')
+
+    def test_shard_units(self):
+        """Test if every metric/project pair is assigned to exactly one shard.
+
+        Returns:
+            expected True
+        """
+        shards = random.randint(1, 10)
+        metric_file_full = [
+            {
+                'metric_name': 'jiradog.bugs' + str(number) + '.count',
+                'projects': ['OPS', 'SYS', 'WEB']
+            }
+            for number in range(random.randint(1, 20))
+        ]
+        units = [(metric['metric_name'], project)
+                 for shard in range(shards)
+                 for metric, project in shard_units(metric_file_full, shard, shards)]
+        all_units = [(metric['metric_name'], project)
+                     for metric in metric_file_full
+                     for project in metric['projects']]
+
+        self.assertEqual(sorted(units), sorted(all_units))
+        self.assertEqual([(metric['metric_name'], project)
+                          for metric, project in shard_units(metric_file_full, 0, 1)],
+                         all_units)
+        self.assertEqual(parse_shard('1/' + str(shards + 1)), (1, shards + 1))
+        self.assertRaises(ValueError, parse_shard, str(shards) + '/' + str(shards))
+
+    def test_validate_metric_file(self):
+        """Test if the example metrics.json matches the schema, and a broken one exits.
+
+        Returns:
+            expected True
+        """
+        metric_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics.json')
+        schema_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   'metrics.schema.json')
+        with open(metric_file) as metric_data_file:
+            metric_data_loaded = json.load(metric_data_file)
+        validate_metric_file(metric_data_loaded, metric_file, schema_file)
+
+        del metric_data_loaded[0]['issues']['jql']
+        self.assertRaises(SystemExit, validate_metric_file,
+                          metric_data_loaded, metric_file, schema_file)
+        with open(schema_file) as schema_data_file:
+            schema = json.load(schema_data_file)
+        validator = jsonschema.validators.validator_for(schema)(schema)
+        error = schema_error(next(validator.iter_errors(metric_data_loaded)))
+        self.assertEqual(error.message, "u'jql' is a required property")
+        self.assertEqual(list(error.absolute_path), [0, 'issues'])
+
+    def test_load_metric_file_cache(self):
+        """Test if requested metrics load in order, from the cache once it's written.
+
+        Returns:
+            expected True
+        """
+        metric_names = ['jiradog.bugs' + str(number) + '.count'
+                        for number in range(random.randint(2, 10))]
+        metric_file = tempfile.mkstemp()[1]
+        state_dir = os.path.join(tempfile.mkdtemp(), 'jiradog')
+        cache_file = os.path.join(state_dir, 'metrics.cache.json')
+        with open(metric_file, 'w') as metric_data_file:
+            json.dump([{'metric_name': name} for name in metric_names], metric_data_file)
+        requested = random.sample(metric_names, 2)
+
+        metric_configs = load_metric_file(metric_file, requested, cache_file=cache_file)
+        self.assertEqual([metric['metric_name'] for metric in metric_configs], requested)
+        self.assertEqual(os.stat(state_dir).st_mode & 0o777, 0o700)
+
+        with open(cache_file) as cache_data_file:
+            cache = json.load(cache_data_file)
+        cache['metrics'] = cache['metrics'][:1]
+        with open(cache_file, 'w') as cache_data_file:
+            json.dump(cache, cache_data_file)
+        self.assertEqual(load_metric_file(metric_file, False, cache_file=cache_file),
+                         [{'metric_name': metric_names[0]}])
+        os.chmod(cache_file, 0o666)
+        self.assertEqual(len(load_metric_file(metric_file, False, cache_file=cache_file)),
+                         len(metric_names))
+        os.remove(metric_file)
+        os.remove(cache_file)
+        os.rmdir(state_dir)
+        os.rmdir(os.path.dirname(state_dir))
+
+    def test_group_values(self):
+        """Test if field values are named for their group, and unnamed ones are left out.
+
+        Returns:
+            expected True
+        """
+        account_id = str(random.randint(0, 99999))
+        issue = JiraProvider.issue_from_raw({
+            'key': 'OPS-1',
+            'fields': {
+                'assignee': {'accountId': account_id, 'displayName': 'Faint Replace'},
+                'reporter': {'self': 'https://example.jira.com/rest/api/2/user'},
+                'priority': {'id': '1', 'name': 'P1'},
+                'customfield_0': {'id': '2', 'value': 'rare'},
+                'components': [],
+                'labels': ['faint', 'rare']
+            }
+        })
+        self.assertEqual(group_values(issue, 'assignee'), [account_id])
+        self.assertEqual(group_values(issue, 'reporter'), [])
+        self.assertEqual(group_values(issue, 'priority'), ['P1'])
+        self.assertEqual(group_values(issue, 'customfield_0'), ['rare'])
+        self.assertEqual(group_values(issue, 'components'), ['none'])
+        self.assertEqual(group_values(issue, 'labels'), ['faint', 'rare'])
+        self.assertEqual(group_values(issue, 'resolution'), ['none'])
+
+    def test_evaluate_groups(self):
+        """Test if issues from one fetch are counted per group_by value.
+
+        Returns:
+            expected True
+        """
+        class PretendJiraObject(object): #pylint: disable=R0903
+            """Fake object, used to imitate the return from the JIRA SDK."""
+            def __init__(self, **attributes):
+                """Define fake attributes"""
+                self.__dict__.update(attributes)
+
+        assignees = ['faint', 'replace', 'rare']
+        issues = []
+        for number in range(random.randint(5, 20)):
+            assignee = random.choice(assignees + [None])
+            issues.append(PretendJiraObject(key='OPS-' + str(number), fields=PretendJiraObject(
+                assignee=PretendJiraObject(name=assignee) if assignee else None,
+                components=[PretendJiraObject(name='API'), PretendJiraObject(name='UI')])))
+        metric = {
+            'metric_name': 'jiradog.bugs.count',
+            'method': 'direct',
+            'issues': {'source': 'jira', 'method': 'ticket_count'},
+            'group_by': ['assignee', 'components']
+        }
+        fetches = []
+        def get_issues(metric, position, project):
+            """Fake data provider, counting fetches."""
+            fetches.append(position)
+            return issues
+
+        groups = evaluate_groups(metric, 'OPS', get_issues)
+        self.assertEqual(fetches, ['issues'])
+        for tags, points in groups:
+            assignee = tags[0].split(':', 1)[1]
+            self.assertEqual(points, len([issue for issue in issues
+                                          if (issue.fields.assignee.name
+                                              if issue.fields.assignee else 'none') == assignee]))
+        self.assertEqual(sum(points for tags, points in groups), len(issues) * 2)
+        del metric['group_by']
+        self.assertEqual(evaluate_groups(metric, 'OPS', get_issues), [([], len(issues))])
+
+    def test_evaluate_groups_changelogs(self):
+        """Test if an issue in several groups has its changelog fetched once.
+
+        Returns:
+            expected True
+        """
+        class PretendJiraProvider(object): #pylint: disable=R0903
+            """Fake data provider, counting changelog fetches."""
+            def __init__(self):
+                """Define fake attributes"""
+                self.fetches = []
+
+            def get_issue_changelog(self, server_url, api_username, api_password, issue_key):
+                """Returns a changelog resolving the issue a day after it was created."""
+                self.fetches.append(issue_key)
+                return [{'created': '2018-01-02T00:00:00.000+0000', 'items': []}]
+
+        issues = [JiraProvider.issue_from_raw({
+            'key': 'OPS-' + str(number),
+            'fields': {'created': '2018-01-01T00:00:00.000+0000',
+                       'components': [{'id': '1', 'name': 'API'}, {'id': '2', 'name': 'UI'}]}
+        }) for number in range(random.randint(1, 10))]
+        metric = {
+            'metric_name': 'jiradog.bugsResolved.meanTimeToResolve',
+            'method': 'average',
+            'numerator': {
+                'source': 'jira',
+                'method': 'mean_time_between_statuses',
+                'statuses': [{'source': 'issue', 'date': '{{issue.fields.created}}'},
+                             {'source': 'changelog', 'date': '{{changelog[0].created}}'}]
+            },
+            'denominator': {'source': 'constant', 'data': {'OPS': 1}},
+            'group_by': ['components']
+        }
+        provider = PretendJiraProvider()
+        jiradog.JP = provider
+        jiradog.API_URL = jiradog.API_USERNAME = jiradog.API_PASSWORD = None
+        try:
+            groups = evaluate_groups(metric, 'OPS', lambda metric, position, project: issues)
+        finally:
+            del jiradog.JP, jiradog.API_URL, jiradog.API_USERNAME, jiradog.API_PASSWORD
+        self.assertEqual(groups, [(['components:API'], len(issues)),
+                                  (['components:UI'], len(issues))])
+        self.assertEqual(sorted(provider.fetches), sorted(issue.key for issue in issues))
+
+    def test_journal(self):
+        """Test if a journal is resumed only by the same run, past a partial last line.
+
+        Returns:
+            expected True
+        """
+        now = time.time()
+        payload = [{'metric': 'jiradog.bugs.count',
+                    'points': [now, random.randint(0, 99)],
+                    'tags': ['jira_project:OPS']}]
+        changelog = [{'created': '2018-01-11T10:20:30.000+0000', 'items': []}]
+        journal_dir = tempfile.mkdtemp()
+
+        journal = Journal()
+        self.assertEqual(journal.open(journal_dir, 'cafe', now), now)
+        self.assertEqual(os.stat(journal.path).st_mode & 0o777, 0o600)
+        overlapping = Journal()
+        self.assertEqual(overlapping.open(journal_dir, 'cafe', now + 30, resume=True), now + 30)
+        self.assertIsNone(overlapping.journal_file)
+        other = Journal()
+        other.open(journal_dir, 'beef', now + 30)
+        journal.record('unit', 'jiradog.bugs.count/OPS', payload)
+        journal.journal_file.write('changelog\tOPS-1\t[{"created"')
+        journal.close()
+
+        journal = Journal()
+        self.assertEqual(journal.open(journal_dir, 'cafe', now + 60, resume=True), now)
+        self.assertEqual(journal.lookup('unit', 'jiradog.bugs.count/OPS'), [payload])
+        self.assertEqual(journal.lookup('changelog', 'OPS-1'), [])
+        journal.record('changelog', 'OPS-1', changelog)
+        journal.close()
+
+        journal = Journal()
+        journal.open(journal_dir, 'cafe', now + 120, resume=True)
+        self.assertEqual(journal.lookup('changelog', 'OPS-1'), [changelog])
+        journal.close()
+
+        journal = Journal()
+        self.assertEqual(journal.open(journal_dir, 'cafe', now + 180), now + 180)
+        self.assertEqual(journal.lookup('unit', 'jiradog.bugs.count/OPS'), [])
+        self.assertTrue(os.path.exists(other.path))
+        journal.remove()
+        other.remove()
+        self.assertEqual(os.listdir(journal_dir), [])
+
+        os.chmod(journal_dir, 0o755)
+        journal = Journal()
+        self.assertEqual(journal.open(journal_dir, 'cafe', now), now)
+        self.assertIsNone(journal.journal_file)
+        os.rmdir(journal_dir)
+
+    def test_jira_search_issues_resume(self):
+        """Test if a resumed search only fetches the pages a killed run didn't.
+
+        Returns:
+            expected True
+        """
+        class PretendJiraObject(object): #pylint: disable=R0903
+            """Fake object, used to imitate the return from the JIRA SDK."""
+            def __init__(self, key):
+                """Define fake attributes"""
+                self.key = key
+                self.raw = {'key': key, 'fields': {}}
+
+        class PretendJiraServer(object): #pylint: disable=R0903
+            """Fake JIRA SDK client, used to imitate a server timing out."""
+            def __init__(self, issues, page_cap, fail_at=None):
+                """Define fake attributes"""
+                self.issues = issues
+                self.page_cap = page_cap
+                self.fail_at = fail_at
+                self.requests = []
+
+            def search_issues(self, query, maxResults, startAt): #pylint: disable=C0103,W0613
+                """Returns a page of issues, raises at fail_at."""
+                self.requests.append(startAt)
+                if startAt == self.fail_at:
+                    raise IOError('timed out')
+                max_results = min(maxResults, self.page_cap)
+                return ResultList(self.issues[startAt:startAt + max_results],
+                                  startAt,
+                                  max_results,
+                                  len(self.issues))
+
+        page_cap = random.randint(1, 20)
+        pages = random.randint(2, 10)
+        issues = [PretendJiraObject('OPS-%s' % number)
+                  for number in range(page_cap * pages + random.randint(0, page_cap - 1))]
+        fail_at = page_cap * random.randint(1, pages - 1)
+        journal_dir = tempfile.mkdtemp()
+
+        pid = os.fork()
+        if pid == 0:
+            # Dies like a killed run or pool worker, without closing the journal.
+            try:
+                JOURNAL.open(journal_dir, 'cafe', time.time())
+                jira = JiraProvider('https://example.jira.com', 'username', 'password')
+                jira._jira = PretendJiraServer(issues, page_cap, fail_at) #pylint: disable=W0212
+                jira.search_issues('project=OPS', 'cafe')
+            finally:
+                os._exit(1) #pylint: disable=W0212
+        os.waitpid(pid, 0)
+
+        JOURNAL.open(journal_dir, 'cafe', time.time(), resume=True)
+        jira = JiraProvider('https://example.jira.com', 'username', 'password')
+        jira._jira = PretendJiraServer(issues, page_cap) #pylint: disable=W0212
+        self.assertEqual([issue.key for issue in jira.search_issues('project=OPS', 'cafe')],
+                         [issue.key for issue in issues])
+        self.assertEqual(jira._jira.requests[0], fail_at) #pylint: disable=W0212
+        JOURNAL.remove()
+        os.rmdir(journal_dir)
+
 if __name__ == '__main__':
     unittest.main()